@@ -1,15 +1,30 @@
 from __future__ import annotations
 
 import re
-import uuid
 import csv
+import functools
+import hashlib
+import itertools
 import json
+import os
+import secrets
+import string
+from collections.abc import Iterator
+from typing import TextIO
 from datetime import date
 from pathlib import Path
+from urllib.parse import quote
+
+try:  # optional: faster JSON for job meta
+    import orjson
+except ImportError:
+    orjson = None
 
 from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 
 from converter import (
     CsvParseOptions,
@@ -21,209 +36,18 @@ from converter import (
 
 APP_TITLE = "CSV → Markdown"
 PREVIEW_MAX_LINES = 40
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+STREAM_CHUNK_SIZE = 1 << 16  # 64 KiB
 
-BASE_CSS = """
-:root {
-  --bg: #F6F5EE;
-  --surface: #FFFFFF;
-  --surface-2: #E4DCCF;
-  --border: #E4DCCF;
-  --text: #111111;
-  --muted: #444444;
-  --shadow: 0 10px 30px rgba(0,0,0,0.08);
-  --accent: #FCB02F;
-  --accent-hover: #F4A81F;
-}
-
-* { box-sizing: border-box; }
-html, body { height: 100%; }
-body {
-  margin: 0;
-  font-family: ui-sans-serif, system-ui, -apple-system, Segoe UI, Roboto, Arial, "Apple Color Emoji", "Segoe UI Emoji";
-  color: var(--text);
-  background: var(--bg);
-}
-
-.container { max-width: 980px; margin: 0 auto; padding: 48px 18px; }
-.topbar { display: flex; align-items: center; justify-content: space-between; gap: 16px; margin-bottom: 22px; }
-.brand { display: flex; align-items: center; gap: 12px; }
-.logo-box {
-  width: 84px;
-  height: 84px;
-  border-radius: 21px;
-  border: 1px solid var(--border);
-  background: #fff;
-  box-shadow: 0 6px 16px rgba(0,0,0,0.08);
-  display: flex;
-  align-items: center;
-  justify-content: center;
-}
-.logo-img {
-  width: 66px;
-  height: 66px;
-  object-fit: contain;
-  display: block;
-}
-.title { margin: 0; font-size: 28px; letter-spacing: -0.02em; }
-.subtitle { margin: 6px 0 0; color: var(--muted); font-size: 14px; }
-
-.card {
-  border: 1px solid var(--border);
-  background: var(--surface);
-  border-radius: 18px;
-  padding: 20px;
-  box-shadow: var(--shadow);
-}
-
-.grid { display: grid; grid-template-columns: 1.1fr 0.9fr; gap: 16px; }
-@media (max-width: 820px) { .grid { grid-template-columns: 1fr; } }
-
-.drop {
-  border: 1px dashed var(--border);
-  border-radius: 16px;
-  padding: 18px;
-  background: rgba(0,0,0,0.02);
-}
-.drop strong { display: block; font-size: 15px; margin-bottom: 6px; }
-.drop span { color: var(--muted); font-size: 13px; }
-.drop .subline { display: block; margin-bottom: 14px; }
-.row { display: flex; align-items: center; justify-content: space-between; gap: 12px; margin-top: 14px; flex-wrap: wrap; }
-
-.pill {
-  display: inline-flex; align-items: center;
-  padding: 8px 10px;
-  border-radius: 999px;
-  border: 1px solid var(--border);
-  background: var(--surface-2);
-  color: var(--muted);
-  font-size: 12px;
-  text-decoration: none;
-}
-.pill:hover { filter: brightness(0.98); }
-
-input[type="file"] { display: none; }
-.btn {
-  display: inline-flex; align-items: center; justify-content: center; gap: 8px;
-  padding: 10px 14px;
-  border-radius: 12px;
-  border: 1px solid var(--border);
-  background: var(--surface);
-  color: var(--text);
-  text-decoration: none;
-  cursor: pointer;
-  transition: transform .08s ease, background .15s ease, border-color .15s ease;
-  user-select: none;
-}
-.btn-lg {
-  height: 48px;
-  padding: 0 16px;
-  font-size: 15px;
-  font-weight: 600;
-}
-.btn:hover { background: rgba(0,0,0,0.03); border-color: rgba(0,0,0,0.18); }
-.btn:active { transform: translateY(1px); }
-.btn-primary {
-  background: var(--accent);
-  border-color: rgba(0,0,0,0.18);
-  color: #000;
-}
-.btn-primary:hover { background: var(--accent-hover); }
-
-.btn-black {
-  background: #111;
-  border-color: #111;
-  color: #fff;
-}
-.btn-black:hover { background: #000; border-color: #000; }
-
-/* File button label truncation (ellipsis) */
-.btn-file {
-  justify-content: flex-start;
-  min-width: 0;
-}
-.btn-file .btn-text {
-  overflow: hidden;
-  text-overflow: ellipsis;
-  white-space: nowrap;
-  min-width: 0;
-  width: 100%;
-}
-
-.btn-pill {
-  background: var(--surface-2);
-  border-color: var(--border);
-  color: var(--muted);
-  font-weight: 600;
-}
-.btn-pill:hover { background: var(--surface-2); border-color: var(--border); }
-.btn-pill:disabled { opacity: 1; cursor: default; }
-
-.w-full { width: 100%; }
-.form-grid { display: grid; gap: 10px; }
-.row-split { display: grid; grid-template-columns: 2fr 1fr; gap: 12px; width: 100%; }
-.row-half { display: grid; grid-template-columns: 1fr 1fr; gap: 12px; width: 100%; }
-@media (max-width: 640px) {
-  .row-split, .row-half { grid-template-columns: 1fr; }
-}
-
-.ml-auto { margin-left: auto; }
-
-.ad-row { display: flex; align-items: center; justify-content: space-between; gap: 12px; flex-wrap: wrap; }
-.ad-row p { margin: 0; color: var(--muted); }
-.ad-row b { color: var(--text); }
-
-.kvs { display: grid; gap: 10px; }
-.kv { display: flex; align-items: center; justify-content: space-between; gap: 12px; padding: 12px; border-radius: 14px; border: 1px solid var(--border); background: rgba(0,0,0,0.02); }
-.kv b { font-size: 13px; }
-.kv code { color: rgba(0,0,0,0.82); }
-.hint { color: var(--muted); font-size: 12px; margin: 10px 0 0; }
-
-select {
-  padding: 10px 12px;
-  height: 44px;
-  border-radius: 12px;
-  border: 1px solid var(--border);
-  background: var(--surface);
-  color: #111;
-}
-select option { color: #111; }
-
-input[type="text"], input[type="number"] {
-  padding: 10px 12px;
-  height: 44px;
-  border-radius: 12px;
-  border: 1px solid var(--border);
-  background: var(--surface);
-  color: #111;
-}
-input[type="number"] { width: 140px; }
-.check { display: inline-flex; align-items: center; gap: 8px; }
-.check input { width: 16px; height: 16px; }
-details { margin-top: 12px; }
-summary { cursor: pointer; color: rgba(0,0,0,0.86); }
-
-pre {
-  margin: 0;
-  white-space: pre;
-  overflow: auto;
-  background: var(--surface);
-  border: 1px solid var(--border);
-  border-radius: 16px;
-  padding: 14px;
-  color: rgba(0,0,0,0.88);
-}
-.section-title { margin: 0 0 10px; font-size: 14px; color: rgba(0,0,0,0.88); }
-"""
-
-
-def _render_page(title: str, content_html: str) -> str:
-    return f"""<!doctype html>
+# The page shell is built once; handlers only fill in the title and the content.
+# Styles live in /static/app.css so browsers can cache them between pages.
+_PAGE_TMPL = string.Template(f"""<!doctype html>
 <html lang="cs">
   <head>
     <meta charset="utf-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1" />
-    <title>{title}</title>
-    <style>{BASE_CSS}</style>
+    <title>$title</title>
+    <link rel="stylesheet" href="/static/app.css" />
   </head>
   <body>
     <div class="container">
@@ -239,60 +63,105 @@ def _render_page(title: str, content_html: str) -> str:
         </div>
         <a class="pill" href="https://lukaskoula.com/" target="_blank" rel="noopener noreferrer">lukaskoula.com</a>
       </div>
-      {content_html}
+      $content
     </div>
   </body>
 </html>
-"""
+""")
+
+
+def _render_page(title: str, content_html: str) -> str:
+    return _PAGE_TMPL.substitute(title=title, content=content_html)
+
+
+def _html_response(html: str, status_code: int = 200) -> Response:
+    # Return a ready Response so FastAPI skips validating/serializing a `str` return value.
+    return Response(html.encode("utf-8"), status_code=status_code, media_type="text/html; charset=utf-8")
 
 
 def _cz_date(d: date) -> str:
     return f"{d.day}. {d.month}. {d.year}"
 
 
-def default_context(d: date | None = None) -> str:
-    if d is None:
-        d = date.today()
+@functools.lru_cache(maxsize=2)
+def _default_context_for(ordinal: int) -> str:
+    # Keyed by day: the header only changes at midnight.
     return f"""# SEO data – organická klíčová slova
 Zdroj: CSV export
-Datum: {_cz_date(d)}
+Datum: {_cz_date(date.fromordinal(ordinal))}
 
 """
 
+
+@functools.lru_cache(maxsize=2)
+def _default_context_bytes(ordinal: int) -> bytes:
+    return _default_context_for(ordinal).encode("utf-8")
+
+
+def default_context(d: date | None = None) -> str:
+    return _default_context_for((d or date.today()).toordinal())
+
 BASE_DIR = Path(__file__).resolve().parent
 STORAGE_DIR = BASE_DIR / "storage"
-UPLOADS_DIR = STORAGE_DIR / "uploads"
-OUTPUTS_DIR = STORAGE_DIR / "outputs"
-META_DIR = STORAGE_DIR / "meta"
+# One directory per job keeps its files together: storage/jobs/<id>/{in.csv,out.md}
+JOBS_DIR = STORAGE_DIR / "jobs"
+UPLOAD_NAME = "in.csv"
+OUTPUT_NAME = "out.md"
+# Job meta is stored as an HTML comment on the first line of out.md (invisible when rendered).
+META_PREFIX = "<!--meta:"
+_META_LINE_RE = re.compile(rb"<!--meta:(\{.*\})-->\r?\n?")
 STATIC_DIR = BASE_DIR / "static"
 
-JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$", re.IGNORECASE)
+# Single-pass replacement for the `&`, `<`, `>` escapes used in HTML output.
+_HTML_ESC = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+JOB_ID_RE = re.compile(r"[0-9a-f]{32}", re.IGNORECASE)  # use with .fullmatch()
+_NON_SAFE_CHARS_RE = re.compile(r"[^\w.\- ]+", re.UNICODE)
+_WS_RE = re.compile(r"\s+")
+# Names the sanitation below would leave untouched: safe chars, single inner spaces,
+# no trailing dot.
+_SAFE_NAME_RE = re.compile(r"(?:[\w.\-]+ )*[\w.\-]*[\w\-]")
 
 app = FastAPI(title=APP_TITLE)
 STATIC_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
-@app.exception_handler(Exception)
-async def _unhandled_exception_handler(_: Request, exc: Exception) -> HTMLResponse:
-    # Last-resort safety net so the user doesn't get a blank "Internal Server Error" page.
-    msg = (f"{type(exc).__name__}: {exc}").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-    content = f"""
+_ERROR_CARD_TMPL = string.Template("""
       <div class="card">
         <p class="section-title">Nastala neočekávaná chyba</p>
         <p class="hint">Pošli mi prosím text chyby níže a opravím to.</p>
-        <pre>{msg}</pre>
+        <pre>$msg</pre>
         <div class="row" style="margin-top:14px;">
           <a class="btn btn-primary" href="/">Zpět na nahrání</a>
         </div>
       </div>
-    """
-    return HTMLResponse(_render_page(f"Chyba – {APP_TITLE}", content), status_code=500)
+    """)
+
+_CSV_ERROR_CARD_TMPL = string.Template("""
+          <div class="card">
+            <p class="section-title">Nepovedlo se převést CSV</p>
+            <p class="hint">Parser narazil na problém ve formátu CSV (typicky neuzavřené uvozovky nebo „divné“ konce řádků).</p>
+            <div class="kvs">
+              <div class="kv"><b>Chyba</b><code>$msg</code></div>
+              <div class="kv"><b>Tip</b><code>Zkus CSV znovu vyexportovat (UTF‑8) nebo otevřít a uložit v Excelu</code></div>
+            </div>
+            <div class="row" style="margin-top:14px;">
+              <a class="btn btn-primary" href="/">Zkusit znovu</a>
+            </div>
+          </div>
+        """)
+
+
+@app.exception_handler(Exception)
+async def _unhandled_exception_handler(_: Request, exc: Exception) -> Response:
+    # Last-resort safety net so the user doesn't get a blank "Internal Server Error" page.
+    msg = (f"{type(exc).__name__}: {exc}").translate(_HTML_ESC)
+    content = _ERROR_CARD_TMPL.substitute(msg=msg)
+    return _html_response(_render_page(f"Chyba – {APP_TITLE}", content), status_code=500)
 
 
 def _ensure_storage_dirs() -> None:
-    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-    OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
-    META_DIR.mkdir(parents=True, exist_ok=True)
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def _safe_basename(filename: str) -> str:
@@ -300,29 +169,99 @@ def _safe_basename(filename: str) -> str:
     name = (filename or "").replace("\\", "/").split("/")[-1].strip()
     if not name:
         return "data"
+    if _SAFE_NAME_RE.fullmatch(name):
+        return name[:120]
     # Replace problematic characters; keep unicode word chars, spaces, dots, dashes, underscores.
-    name = re.sub(r"[^\w.\- ]+", "_", name, flags=re.UNICODE)
-    name = re.sub(r"\s+", " ", name).strip().rstrip(". ")
+    name = _NON_SAFE_CHARS_RE.sub("_", name)
+    name = _WS_RE.sub(" ", name).strip().rstrip(". ")
     if not name:
         return "data"
     # Avoid overly long filenames.
     return name[:120]
 
 
+def _save_upload(src, dest: Path, keep: bool = False) -> bytearray | None:
+    # Copy the spooled upload to disk in chunks instead of reading it into memory first.
+    # With `keep`, the same pass also collects the bytes for decoding, so the stored
+    # file doesn't have to be read back.
+    buf = bytearray() if keep else None
+    with dest.open("wb") as out:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            out.write(chunk)
+            if buf is not None:
+                buf.extend(chunk)
+    return buf
+
+
 def _download_md_filename(original_filename: str) -> str:
     base = _safe_basename(original_filename)
     stem = Path(base).stem or "data"
     return f"{stem}.md"
 
 
+def _content_disposition(filename: str) -> str:
+    # Same shape as Starlette's FileResponse: RFC 5987 encoding for non-ASCII names.
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _write_parts(path: Path, parts: list[bytes]) -> None:
+    # Hand all parts to the kernel in one writev() instead of concatenating them first.
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        written = os.writev(fd, parts) if hasattr(os, "writev") else 0
+        if written < sum(map(len, parts)):
+            # Short write (or no writev, e.g. Windows): finish with plain writes.
+            view = memoryview(b"".join(parts))[written:]
+            while view:
+                view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _json_dumps(obj: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _persist_job(output_path: Path, context: bytes, body_md: str, meta: dict) -> None:
+    meta_line = META_PREFIX.encode("utf-8") + _json_dumps(meta) + b"-->\n"
+    _write_parts(output_path, [meta_line, context, body_md.encode("utf-8")])
+
+
+@functools.lru_cache(maxsize=4096)
+def _load_meta(job_id: str) -> str:
+    """
+    Download filename for a finished job, read from the meta line of its output.
+    Outputs are write-once and a job id is only handed out once its output is
+    written, so the result (including the fallback for missing meta) can be cached.
+    """
+    download_name = f"{job_id}.md"
+    try:
+        with (JOBS_DIR / job_id / OUTPUT_NAME).open("rb") as f:
+            m = _META_LINE_RE.fullmatch(f.readline())
+        if m:
+            download_name = _json_loads(m.group(1)).get("download_filename") or download_name
+    except Exception:
+        pass
+    return download_name
+
+
 @app.on_event("startup")
 def _startup() -> None:
     _ensure_storage_dirs()
 
 
-@app.get("/", response_class=HTMLResponse)
-def index() -> str:
-    content = """
+_INDEX_CONTENT = """
       <div class="card">
         <div class="grid">
           <div class="drop">
@@ -352,6 +291,10 @@ def index() -> str:
 
                 <div class="row" style="justify-content:flex-start;">
                   <button class="btn btn-pill" type="button" disabled>Vygeneruje se odkaz ke stažení</button>
+                  <label class="check">
+                    <input type="checkbox" name="download_now" value="1" />
+                    <span>Rovnou stáhnout (bez náhledu)</span>
+                  </label>
                 </div>
 
                 <details style="width:100%;">
@@ -428,8 +371,8 @@ def index() -> str:
             </p>
           </div>
           <div class="kvs">
-            <div class="kv"><b>Upload</b><code>storage/uploads/&lt;id&gt;.csv</code></div>
-            <div class="kv"><b>Výstup</b><code>storage/outputs/&lt;id&gt;.md</code></div>
+            <div class="kv"><b>Upload</b><code>storage/jobs/&lt;id&gt;/in.csv</code></div>
+            <div class="kv"><b>Výstup</b><code>storage/jobs/&lt;id&gt;/out.md</code></div>
             <div class="kv"><b>Hlavička</b><code>Datum: dnes (automaticky)</code></div>
           </div>
         </div>
@@ -455,7 +398,18 @@ def index() -> str:
         });
       </script>
     """
-    return _render_page(APP_TITLE, content)
+
+# The index page never changes at runtime: render and encode it once.
+_INDEX_BYTES = _render_page(APP_TITLE, _INDEX_CONTENT).encode("utf-8")
+_INDEX_ETAG = '"' + hashlib.md5(_INDEX_BYTES, usedforsecurity=False).hexdigest() + '"'
+_INDEX_HEADERS = {"Cache-Control": "public, max-age=300", "ETag": _INDEX_ETAG}
+
+
+@app.get("/", response_class=HTMLResponse)
+def index(request: Request) -> Response:
+    if request.headers.get("if-none-match") == _INDEX_ETAG:
+        return Response(status_code=304, headers=_INDEX_HEADERS)
+    return Response(content=_INDEX_BYTES, media_type="text/html; charset=utf-8", headers=_INDEX_HEADERS)
 
 
 @app.post("/convert", response_class=HTMLResponse)
@@ -476,13 +430,14 @@ async def convert(
     eol: str = Form("lf"),
     quote_mode: str = Form("standard"),
     quotechar: str = Form("\""),
-) -> str:
-    _ensure_storage_dirs()
-
-    job_id = uuid.uuid4().hex  # 32 hex chars
-    upload_path = UPLOADS_DIR / f"{job_id}.csv"
-    output_path = OUTPUTS_DIR / f"{job_id}.md"
-    meta_path = META_DIR / f"{job_id}.json"
+    download_now: bool = Form(False),
+) -> Response:
+    job_id = secrets.token_hex(16)  # 32 hex chars
+    job_dir = JOBS_DIR / job_id
+    # Storage root is created on startup; `parents` only matters if it was removed since.
+    job_dir.mkdir(parents=True)
+    upload_path = job_dir / UPLOAD_NAME
+    output_path = job_dir / OUTPUT_NAME
 
     def _int_or_none(s: str) -> int | None:
         s = (s or "").strip()
@@ -493,10 +448,13 @@ async def convert(
         except Exception:
             return None
 
-    raw = await file.read()
-    csv_text = decode_csv_bytes_with_encoding(raw, encoding=encoding)
-
-    upload_path.write_bytes(raw)
+    # File I/O, decoding and conversion are blocking/CPU-bound: run them in the threadpool
+    # so a large CSV doesn't stall other requests on the event loop.
+    # Explicit UTF-8 needs no detection: the parser decodes the stored file lazily instead
+    # of holding the whole text in memory. Other encodings ("auto" may fall back to
+    # CP1250) need the raw bytes up front.
+    lazy_utf8 = (encoding or "").strip().lower() in {"utf-8", "utf8"}
+    raw = await run_in_threadpool(_save_upload, file.file, upload_path, not lazy_utf8)
 
     try:
         parse = CsvParseOptions(
@@ -518,93 +476,95 @@ async def convert(
                 ignore_case=bool(ignore_case),
             )
 
-        if format == "table":
-            body_md = csv_text_to_markdown_table(
-                csv_text,
-                parse=parse,
-                positions=fields or None,
-                add_line_numbers=bool(line_numbers),
-                sort=sort,
-                eol=eol,
-                table_style="markdown",
-            )
-        elif format == "jira":
-            body_md = csv_text_to_markdown_table(
-                csv_text,
-                parse=parse,
-                positions=fields or None,
-                add_line_numbers=bool(line_numbers),
-                sort=sort,
-                eol=eol,
-                table_style="jira",
-            )
-        else:
-            body_md = csv_text_to_markdown_notebooklm(
-                csv_text,
-                detail="full",
-                parse=parse,
-                positions=fields or None,
-                sort=sort,
-            )
+        def _to_markdown() -> str:
+            if lazy_utf8:
+                with upload_path.open("r", encoding="utf-8-sig", newline="") as src:
+                    return _convert(src)
+            return _convert(decode_csv_bytes_with_encoding(raw, encoding=encoding))
+
+        def _convert(csv_text: str | TextIO) -> str:
+            if format == "table":
+                return csv_text_to_markdown_table(
+                    csv_text,
+                    parse=parse,
+                    positions=fields or None,
+                    add_line_numbers=bool(line_numbers),
+                    sort=sort,
+                    eol=eol,
+                    table_style="markdown",
+                )
+            elif format == "jira":
+                return csv_text_to_markdown_table(
+                    csv_text,
+                    parse=parse,
+                    positions=fields or None,
+                    add_line_numbers=bool(line_numbers),
+                    sort=sort,
+                    eol=eol,
+                    table_style="jira",
+                )
+            else:
+                return csv_text_to_markdown_notebooklm(
+                    csv_text,
+                    detail="full",
+                    parse=parse,
+                    positions=fields or None,
+                    sort=sort,
+                )
+
+        body_md = await run_in_threadpool(_to_markdown)
     except csv.Error as e:
-        content = f"""
-          <div class="card">
-            <p class="section-title">Nepovedlo se převést CSV</p>
-            <p class="hint">Parser narazil na problém ve formátu CSV (typicky neuzavřené uvozovky nebo „divné“ konce řádků).</p>
-            <div class="kvs">
-              <div class="kv"><b>Chyba</b><code>{str(e).replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")}</code></div>
-              <div class="kv"><b>Tip</b><code>Zkus CSV znovu vyexportovat (UTF‑8) nebo otevřít a uložit v Excelu</code></div>
-            </div>
-            <div class="row" style="margin-top:14px;">
-              <a class="btn btn-primary" href="/">Zkusit znovu</a>
-            </div>
-          </div>
-        """
-        return HTMLResponse(_render_page(f"Chyba – {APP_TITLE}", content), status_code=400)
+        content = _CSV_ERROR_CARD_TMPL.substitute(msg=str(e).translate(_HTML_ESC))
+        return _html_response(_render_page(f"Chyba – {APP_TITLE}", content), status_code=400)
 
-    md_full = default_context() + body_md
-    output_path.write_text(md_full, encoding="utf-8")
+    context = _default_context_bytes(date.today().toordinal())
 
     # Persist original name for download (NotebookLM-friendly).
     download_name = _download_md_filename(getattr(file, "filename", "") or "")
-    meta_path.write_text(
-        json.dumps(
-            {
-                "input_filename": (getattr(file, "filename", "") or ""),
-                "download_filename": download_name,
-            },
-            ensure_ascii=False,
-        ),
-        encoding="utf-8",
-    )
+    meta = {"download_filename": download_name}
+
+    if download_now:
+        # Send the markdown straight back; the job is still stored, just after the response.
+        def iter_md_chunks() -> Iterator[str | bytes]:
+            yield context
+            for i in range(0, len(body_md), STREAM_CHUNK_SIZE):
+                yield body_md[i : i + STREAM_CHUNK_SIZE]
+
+        response = StreamingResponse(
+            iter_md_chunks(),
+            media_type="text/markdown; charset=utf-8",
+            headers={"Content-Disposition": _content_disposition(download_name)},
+        )
+        response.background = BackgroundTask(_persist_job, output_path, context, body_md, meta)
+        return response
+
+    await run_in_threadpool(_persist_job, output_path, context, body_md, meta)
     # Post/Redirect/Get: avoid resubmitting the form on refresh.
     return RedirectResponse(url=f"/result/{job_id}", status_code=303)
 
 
 @app.get("/result/{job_id}", response_class=HTMLResponse)
-def result(job_id: str) -> str:
-    if not JOB_ID_RE.match(job_id):
+def result(job_id: str) -> Response:
+    if not JOB_ID_RE.fullmatch(job_id):
         raise HTTPException(status_code=404, detail="Not found")
 
-    path = OUTPUTS_DIR / f"{job_id}.md"
+    path = JOBS_DIR / job_id / OUTPUT_NAME
     if not path.exists():
         raise HTTPException(status_code=404, detail="Not found")
 
-    meta_path = META_DIR / f"{job_id}.json"
-    download_name = f"{job_id}.md"
-    if meta_path.exists():
-        try:
-            download_name = json.loads(meta_path.read_text(encoding="utf-8")).get("download_filename") or download_name
-        except Exception:
-            pass
+    download_name = _load_meta(job_id)
 
-    md_full = path.read_text(encoding="utf-8")
-    lines = md_full.splitlines()
-    truncated = len(lines) > PREVIEW_MAX_LINES
-    preview_text = "\n".join(lines[:PREVIEW_MAX_LINES])
+    # Only read as many lines as the preview shows (+1 to know whether it was cut),
+    # skipping the meta line.
+    with path.open("r", encoding="utf-8") as f:
+        head = f.readline()
+        first = [] if head.startswith(META_PREFIX) else [head]
+        first.extend(itertools.islice(f, PREVIEW_MAX_LINES + 1 - len(first)))
+    truncated = len(first) > PREVIEW_MAX_LINES
+    preview_text = "".join(first[:PREVIEW_MAX_LINES])
     if truncated:
-        preview_text += "\n...\n"
-    preview = preview_text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        preview_text += "...\n"
+    preview = preview_text.translate(_HTML_ESC)
     content = f"""
       <div class="card">
         <div class="grid">
@@ -615,12 +575,12 @@ def result(job_id: str) -> str:
               <a class="btn" href="/">Nahrát další</a>
               <span class="pill">Soubor: <code>{download_name}</code></span>
             </div>
-            <p class="hint">Soubor je uložený do <code>storage/outputs/{job_id}.md</code> (výstup je vždy UTF‑8).</p>
+            <p class="hint">Soubor je uložený do <code>storage/jobs/{job_id}/out.md</code> (výstup je vždy UTF‑8).</p>
           </div>
           <div class="kvs">
             <div class="kv"><b>Hlavička</b><code>Datum: automaticky</code></div>
             <div class="kv"><b>Stažení</b><code>/download/{job_id}</code></div>
-            <div class="kv"><b>Uložení</b><code>storage/outputs/</code></div>
+            <div class="kv"><b>Uložení</b><code>storage/jobs/</code></div>
           </div>
         </div>
         <div style="margin-top:16px;">
@@ -629,31 +589,36 @@ def result(job_id: str) -> str:
         </div>
       </div>
     """
-    return _render_page(f"Hotovo – {APP_TITLE}", content)
+    return _html_response(_render_page(f"Hotovo – {APP_TITLE}", content))
 
 
 @app.get("/download/{job_id}")
-def download(job_id: str) -> FileResponse:
-    if not JOB_ID_RE.match(job_id):
-        # Avoid path traversal; only accept UUID hex.
+def download(job_id: str, request: Request) -> Response:
+    if not JOB_ID_RE.fullmatch(job_id):
+        # Avoid path traversal; only accept 32-char hex job ids.
         raise HTTPException(status_code=404, detail="Not found")
 
-    path = OUTPUTS_DIR / f"{job_id}.md"
-    if not path.exists():
+    path = JOBS_DIR / job_id / OUTPUT_NAME
+    # One stat() serves as the existence check and is handed to FileResponse,
+    # which would otherwise stat the file again.
+    try:
+        st = path.stat()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Not found")
 
-    meta_path = META_DIR / f"{job_id}.json"
-    download_name = f"{job_id}.md"
-    if meta_path.exists():
-        try:
-            download_name = json.loads(meta_path.read_text(encoding="utf-8")).get("download_filename") or download_name
-        except Exception:
-            pass
+    headers = {
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "ETag": f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    download_name = _load_meta(job_id)
 
     return FileResponse(
         path=path,
         media_type="text/markdown; charset=utf-8",
         filename=download_name,
+        stat_result=st,
+        headers=headers,
     )
-
-
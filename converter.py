@@ -1,61 +1,88 @@
+import codecs
 import csv
+import functools
 import io
 import itertools
+import mmap
+import operator
+from collections import Counter
 from dataclasses import dataclass
-from typing import List
+from typing import Final, Iterable, Iterator, List, TextIO
 
 
-def decode_csv_bytes(raw: bytes) -> str:
+_UTF16_PROBE_BYTES = 512
+
+
+def decode_csv_bytes(raw: "bytes | bytearray | memoryview | mmap.mmap") -> str:
     """
     Decode CSV bytes into text.
     Handles common Windows/Excel exports (UTF-16 with BOM) and UTF-8 with BOM.
+    Any buffer object is accepted (e.g. an mmap of the input file); it is decoded in place.
     """
+    head = bytes(raw[:_UTF16_PROBE_BYTES])
+
     # UTF-16 BOMs (Excel on Windows often exports TSV/CSV like this)
-    if raw.startswith(b"\xff\xfe") or raw.startswith(b"\xfe\xff"):
-        return raw.decode("utf-16")
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return str(raw, "utf-16")
+
+    # BOM-less UTF-16 puts a NUL in every other byte of ASCII content; probe a raw
+    # prefix for that instead of decoding as UTF-8 first and scanning the whole text.
+    # The NULs sit in the odd bytes for little-endian and in the even bytes for big-endian.
+    if not head.startswith(codecs.BOM_UTF8) and head.count(b"\x00") > len(head) // 4:
+        big_endian = head[0::2].count(b"\x00") > head[1::2].count(b"\x00")
+        try:
+            return str(raw, "utf-16-be" if big_endian else "utf-16-le")
+        except UnicodeDecodeError:
+            pass
 
     # UTF-8 (with optional BOM)
     try:
-        text = raw.decode("utf-8-sig")
-        # If the file was actually UTF-16 but decoded as UTF-8, it will contain lots of NULs.
-        if "\x00" in text:
-            return raw.decode("utf-16")
-        return text
+        return str(raw, "utf-8-sig")
     except UnicodeDecodeError:
         pass
 
     # Common Central European fallback
     try:
-        return raw.decode("cp1250")
+        return str(raw, "cp1250")
     except UnicodeDecodeError:
-        return raw.decode("utf-8", errors="replace")
+        return str(raw, "utf-8", errors="replace")
 
 
-def decode_csv_bytes_with_encoding(raw: bytes, encoding: str = "auto") -> str:
+@functools.lru_cache(maxsize=32)
+def _resolve_encoding(encoding: str | None) -> tuple[str | None, str]:
+    # Form value -> (codec, errors); codec None means auto-detect. Cached so repeated
+    # conversions skip the string normalization and alias dispatch.
     enc = (encoding or "auto").strip().lower()
     if enc == "auto":
-        return decode_csv_bytes(raw)
+        return None, "strict"
     if enc in {"utf-16", "utf16"}:
-        return raw.decode("utf-16")
+        return "utf-16", "strict"
     if enc in {"utf-8", "utf8"}:
-        return raw.decode("utf-8-sig")
+        return "utf-8-sig", "strict"
     if enc in {"cp1250", "windows-1250", "win1250"}:
-        return raw.decode("cp1250")
+        return "cp1250", "strict"
     # Last resort
-    return raw.decode(enc, errors="replace")
+    return enc, "replace"
+
+
+def decode_csv_bytes_with_encoding(raw: bytes, encoding: str = "auto") -> str:
+    codec, errors = _resolve_encoding(encoding)
+    if codec is None:
+        return decode_csv_bytes(raw)
+    return str(raw, codec, errors)
+
+
+# Minimal escaping for Markdown tables, applied in a single pass:
+# - pipes break table columns
+# - newlines break rows
+_CELL_TRANS = str.maketrans({"\x00": "", "|": "\\|", "\r": " ", "\n": " "})
 
 
 def _escape_md_cell(value: str) -> str:
-    # Minimal escaping for Markdown tables.
-    # - pipes break table columns
-    # - newlines break rows
-    return (
-        value.replace("\x00", "")
-        .replace("|", "\\|")
-        .replace("\r\n", " ")
-        .replace("\n", " ")
-        .replace("\r", " ")
-    )
+    if "\r" in value:
+        # "\r\n" must become one space, not two.
+        value = value.replace("\x00", "").replace("\r\n", "\n")
+    return value.translate(_CELL_TRANS)
 
 
 def _normalize_preamble(preamble: str) -> str:
@@ -102,78 +129,161 @@ def _parse_positions(positions: str | None) -> list[int] | None:
     return out or None
 
 
-def _parse_csv(csv_text: str, opts: CsvParseOptions) -> tuple[list[str], list[list[str]]]:
-    # Try to sniff delimiter (often "," or ";" in CZ exports). If sniffing fails, fall back to excel dialect.
-    dialect: csv.Dialect = csv.excel
+_DELIMITER_CANDIDATES = (",", ";", "\t", "|")
+
+
+def _sniff_delimiter(sample: str) -> tuple[str, bool]:
+    """
+    Pick the delimiter whose per-line count is the most consistent over the first lines
+    (ties go to the earlier candidate). Returns (delimiter, skipinitialspace) and falls
+    back to the excel default when no candidate appears at all.
+    """
+    lines = [ln for ln in sample.splitlines()[:20] if ln]
+    best, best_score = ",", (0.0, 0)
+    for d in _DELIMITER_CANDIDATES:
+        counts = [ln.count(d) for ln in lines]
+        mode, freq = Counter(counts).most_common(1)[0] if counts else (0, 0)
+        if mode == 0:
+            continue
+        score = (freq / len(counts), mode)
+        if score > best_score:
+            best, best_score = d, score
+    # Like csv.Sniffer: skip spaces after the delimiter if the first line always has them.
+    first = lines[0] if lines else ""
+    skipinitialspace = best_score[1] > 0 and first.count(best) == first.count(best + " ")
+    return best, skipinitialspace
+
+
+@functools.lru_cache(maxsize=64)
+def _make_dialect(delimiter: str, quotechar: str, quoting: int, skipinitialspace: bool) -> type[csv.Dialect]:
+    # Per-combination csv.excel subclass, built once; the shared csv.excel is never modified.
+    return type(
+        "_CsvDialect",
+        (csv.excel,),
+        {
+            "delimiter": delimiter,
+            "quotechar": quotechar,
+            "quoting": quoting,
+            "doublequote": True,
+            "skipinitialspace": skipinitialspace,
+        },
+    )
+
+
+_SOURCE_WINDOW = 1 << 20
+
+
+def _iter_text_lines(text: str) -> Iterator[str]:
+    # io.StringIO keeps a UCS-4 copy of its whole initial value (4x the text for ASCII),
+    # so large inputs are fed to the csv reader through ~1 MiB windows cut after a line
+    # break; records spanning a window boundary are joined by the reader as usual.
+    n = len(text)
+    start = 0
+    while start < n:
+        end = start + _SOURCE_WINDOW
+        if end < n:
+            cut = text.rfind("\n", start, end)
+            if cut < 0:
+                cut = text.rfind("\r", start, end)
+                if cut >= 0 and text.startswith("\n", cut + 1):
+                    cut += 1
+            end = cut + 1 if cut >= 0 else n
+        yield from io.StringIO(text[start:end], newline="")
+        start = end
+
+
+def _split_unquoted(lines: Iterable[str], delimiter: str) -> Iterator[list[str]]:
+    # QUOTE_NONE records without the csv state machine: every delimiter separates fields
+    # and every line is one record (blank lines give [], as csv.reader does).
+    for line in lines:
+        line = line.rstrip("\r\n")
+        yield line.split(delimiter) if line else []
+
+
+def _parse_csv(csv_text: str | TextIO, opts: CsvParseOptions) -> tuple[list[str], list[list[str]]]:
+    # `csv_text` may also be a seekable text stream opened with newline="" (e.g. an uploaded
+    # file decoded lazily); the csv module then handles line endings while reading.
+    if isinstance(csv_text, str):
+        sample = csv_text[:4096]
+    else:
+        sample = csv_text.read(4096)
+        csv_text.seek(0)
+
+    # Detect delimiter (often "," or ";" in CZ exports) unless given explicitly.
     delim = (opts.delimiter or "auto")
     if delim == "tab":
         delim = "\t"
     if delim == "pipe":
         delim = "|"
-    if delim != "auto":
-        # create a dialect-ish object
-        dialect = csv.excel
-        dialect.delimiter = delim  # type: ignore[attr-defined]
-    else:
-        try:
-            dialect = csv.Sniffer().sniff(csv_text[:4096], delimiters=",;\t|")
-        except csv.Error:
-            pass
+    skipinitialspace = False
+    if delim == "auto":
+        delim, skipinitialspace = _sniff_delimiter(sample)
 
     quotechar = (opts.quotechar or '"')[:1]
     quoting = csv.QUOTE_MINIMAL
     if opts.quote_mode == "no_quotes":
         quoting = csv.QUOTE_NONE
 
-    # Apply quoting options to dialect
-    try:
-        dialect.quotechar = quotechar  # type: ignore[attr-defined]
-        dialect.quoting = quoting  # type: ignore[attr-defined]
-        dialect.doublequote = True  # type: ignore[attr-defined]
-    except Exception:
-        pass
+    dialect = _make_dialect(delim, quotechar, quoting, skipinitialspace)
+
+    # The csv module handles "\r\n", "\r" and "\n" itself when reading with newline="",
+    # so the text is not normalized up front.
+    if isinstance(csv_text, str):
+        source: Iterable[str] = _iter_text_lines(csv_text)
+    else:
+        source = csv_text
+
+    # skip / limit are applied while reading, so rows outside the window are never kept
+    # (and a parse error past the limit no longer matters).
+    skip = max(0, int(opts.skip_lines or 0))
+    stop = skip + max(0, int(opts.limit_lines)) if opts.limit_lines is not None else None
+
+    def collect(records: Iterable[list[str]]) -> tuple[list[str], list[list[str]]]:
+        it = itertools.islice(records, skip, stop)
+        if opts.has_header:
+            first = next(it, None)
+            if first is None:
+                return [], []
+            headers = [_clean_header(h) for h in first]
+            # Every record source yields a fresh list per row; keep them as they are.
+            rows = list(it)
+        else:
+            rows = list(it)
+            width = max((len(r) for r in rows), default=0)
+            headers = [f"Field {i+1}" for i in range(width)]
+        return headers, rows
 
-    normalized = csv_text.replace("\r\n", "\n").replace("\r", "\n")
+    # Without quoting (and without skipinitialspace) a plain split gives exactly what
+    # csv.reader would, a bit faster; it cannot raise csv.Error either.
+    if quoting == csv.QUOTE_NONE and not skipinitialspace:
+        return collect(_split_unquoted(source, delim))
 
-    # Preferred parsing path: mimic `open(..., newline="")` behavior even though we read from text.
+    # Preferred parsing path
     try:
-        reader = list(csv.reader(io.StringIO(normalized, newline=""), dialect, quotechar=quotechar, quoting=quoting))
+        return collect(csv.reader(source, dialect))
     except csv.Error:
+        if isinstance(csv_text, str):
+            text = csv_text
+        else:
+            # The fallbacks below work on the whole text; only now read it into memory.
+            csv_text.seek(0)
+            text = csv_text.read()
         # Best-effort fallback for some broken exports that trigger:
         # `_csv.Error: new-line character seen in unquoted field`
         # We split into physical lines (no newline chars inside each provided "line"),
         # which avoids the csv module interpreting embedded newlines inside a field.
+        # Both fallbacks share one split of the text.
+        physical_lines = text.splitlines()
         try:
-            reader = list(csv.reader(normalized.splitlines(), dialect, quotechar=quotechar, quoting=quoting))
+            return collect(csv.reader(physical_lines, dialect))
         except csv.Error:
             # Last-resort fallback: naive split (ignores quoting). This prioritizes "generate something"
             # over strict CSV correctness and avoids hard failures for messy exports.
-            lines = [ln for ln in normalized.split("\n") if ln != ""]
+            lines = [ln for ln in physical_lines if ln]
             first = lines[0] if lines else ""
-            candidates = [getattr(dialect, "delimiter", ","), ";", ",", "\t", "|"]
+            candidates = [delim, ";", ",", "\t", "|"]
             delim = max(candidates, key=lambda d: first.count(d) if d else -1) or ","
-            reader = [ln.split(delim) for ln in lines]
-
-    # skip / limit
-    skip = max(0, int(opts.skip_lines or 0))
-    if skip:
-        reader = reader[skip:]
-
-    if opts.limit_lines is not None:
-        lim = max(0, int(opts.limit_lines))
-        reader = reader[:lim]
-
-    if not reader:
-        return [], []
-
-    if opts.has_header:
-        headers = [_clean_header(h) for h in reader[0]]
-        rows = [list(r) for r in reader[1:]]
-    else:
-        width = max((len(r) for r in reader), default=0)
-        headers = [f"Field {i+1}" for i in range(width)]
-        rows = [list(r) for r in reader]
-    return headers, rows
+            return collect(ln.split(delim) for ln in lines)
 
 
 def _apply_positions(headers: list[str], rows: list[list[str]], positions_1based: list[int] | None) -> tuple[list[str], list[list[str]]]:
@@ -184,40 +294,60 @@ def _apply_positions(headers: list[str], rows: list[list[str]], positions_1based
     if not idxs:
         return headers, rows
     new_headers = [headers[i] for i in idxs]
+    need = max(idxs) + 1
+    if all(len(r) >= need for r in rows):
+        # Every row has all selected columns: project in C via itemgetter.
+        if len(idxs) == 1:
+            i = idxs[0]
+            return new_headers, [[r[i]] for r in rows]
+        get = operator.itemgetter(*idxs)
+        return new_headers, [list(get(r)) for r in rows]
+    # Ragged rows: pad missing cells.
     new_rows: list[list[str]] = []
     for r in rows:
         new_rows.append([r[i] if i < len(r) else "" for i in idxs])
     return new_headers, new_rows
 
 
-def _apply_sort(rows: list[list[str]], key: SortKey, headers_len: int) -> list[list[str]]:
-    idx = max(0, min(headers_len - 1, key.field_1based - 1))
+# Decimal comma ("1,5") -> decimal point, for numeric sorts of CZ exports.
+_DECIMAL_COMMA = str.maketrans(",", ".")
 
-    def get_val(r: list[str]) -> str:
-        return r[idx] if idx < len(r) else ""
 
-    def to_num(v: str) -> float:
-        v = (v or "").strip().replace(",", ".")
-        try:
-            return float(v)
-        except Exception:
-            return float("-inf")
+def _to_num(v: str) -> float:
+    # float() already ignores surrounding whitespace; non-numbers sort first.
+    try:
+        return float(v.translate(_DECIMAL_COMMA))
+    except ValueError:
+        return float("-inf")
+
+
+def _apply_sort(rows: list[list[str]], key: SortKey, headers_len: int) -> list[list[str]]:
+    idx = max(0, min(headers_len - 1, key.field_1based - 1))
 
     reverse = (key.direction or "asc").lower() == "desc"
     typ = (key.type or "string").lower()
     ignore_case = bool(key.ignore_case)
 
+    # Decorate once: pull the sort column out, convert it with map() (no per-row lambda
+    # calls), then sort on the precomputed keys only (ties keep their input order).
+    col = [r[idx] if idx < len(r) else "" for r in rows]
     if typ == "numeric":
-        return sorted(rows, key=lambda r: to_num(get_val(r)), reverse=reverse)
+        keys: list = list(map(_to_num, col))
+    elif ignore_case:
+        keys = list(map(str.casefold, col))
+    else:
+        keys = col
+    decorated = list(zip(keys, rows))
+    decorated.sort(key=operator.itemgetter(0), reverse=reverse)
+    return [r for _, r in decorated]
 
-    if ignore_case:
-        return sorted(rows, key=lambda r: get_val(r).casefold(), reverse=reverse)
-    return sorted(rows, key=lambda r: get_val(r), reverse=reverse)
 
+# Data rows rendered per chunk yielded by iter_markdown_table_lines().
+_ROW_BLOCK = 512
 
-def csv_text_to_markdown_table(
-    csv_text: str,
-    preamble: str = "",
+
+def iter_markdown_table_lines(
+    csv_text: str | TextIO,
     *,
     parse: CsvParseOptions | None = None,
     positions: str | None = None,
@@ -225,9 +355,10 @@ def csv_text_to_markdown_table(
     sort: SortKey | None = None,
     eol: str = "lf",  # lf | crlf
     table_style: str = "markdown",  # markdown | jira
-) -> str:
+) -> Iterator[str]:
     """
-    Convert CSV text to a Markdown table (or Jira table).
+    Yield the Markdown (or Jira) table for `csv_text` as chunks of whole lines (line endings
+    included). Lets callers write the table out without holding the whole output in memory.
     """
     if parse is None:
         parse = CsvParseOptions()
@@ -241,26 +372,68 @@ def csv_text_to_markdown_table(
         headers = ["#"] + headers
         rows = [[str(i + 1)] + r for i, r in enumerate(rows)]
 
-    headers_escaped = [_escape_md_cell(h) for h in headers]
+    headers_escaped = list(map(_escape_md_cell, headers))
+    line_ending = "\r\n" if (eol or "lf").lower() == "crlf" else "\n"
 
-    out: List[str] = []
     if table_style == "jira":
-        out.append("|| " + " || ".join(headers_escaped) + " ||")
+        yield "|| " + " || ".join(headers_escaped) + " ||" + line_ending
     else:
-        out.append("| " + " | ".join(headers_escaped) + " |")
-        out.append("|" + "|".join(["---"] * len(headers_escaped)) + "|")
-
-    for row in rows:
-        row_escaped = [_escape_md_cell(c) for c in row]
-        if table_style == "jira":
-            out.append("| " + " | ".join(row_escaped) + " |")
-        else:
-            out.append("| " + " | ".join(row_escaped) + " |")
+        yield "| " + " | ".join(headers_escaped) + " |" + line_ending
+        # "|---|---|"; a table without columns keeps its "||" separator.
+        yield "|" + ("---|" * len(headers_escaped) or "|") + line_ending
+
+    # Data rows look the same in both styles. Most rows need no escaping at all, so rows
+    # are rendered a block at a time: join the raw cells of the whole block in C, then
+    # count pipes and line breaks against what the framing alone produces. Any surplus
+    # (a pipe, CR/LF or NUL inside a cell, or an empty row) sends that block through the
+    # per-row path, which escapes cell by cell only where needed.
+    row_end = " |" + line_ending
+    row_sep = row_end + "| "
+    sep_cr = line_ending.count("\r")
+    for start in range(0, len(rows), _ROW_BLOCK):
+        block = rows[start : start + _ROW_BLOCK]
+        n = len(block)
+        text = row_sep.join(map(" | ".join, block))
+        if (
+            text.count("|") == sum(map(len, block)) + n - 2
+            and text.count("\n") == n - 1
+            and text.count("\r") == sep_cr * (n - 1)
+            and "\x00" not in text
+        ):
+            yield "| " + text + row_end
+            continue
+        for row in block:
+            line = " | ".join(row)
+            if line.count("|") != len(row) - 1 or "\n" in line or "\r" in line or "\x00" in line:
+                line = " | ".join(map(_escape_md_cell, row))
+            yield "| " + line + row_end
 
-    line_ending = "\r\n" if (eol or "lf").lower() == "crlf" else "\n"
-    table = line_ending.join(out) + line_ending
 
-    return _normalize_preamble(preamble) + table
+def csv_text_to_markdown_table(
+    csv_text: str | TextIO,
+    preamble: str = "",
+    *,
+    parse: CsvParseOptions | None = None,
+    positions: str | None = None,
+    add_line_numbers: bool = False,
+    sort: SortKey | None = None,
+    eol: str = "lf",  # lf | crlf
+    table_style: str = "markdown",  # markdown | jira
+) -> str:
+    """
+    Convert CSV text to a Markdown table (or Jira table).
+    `csv_text` may be a string or a seekable text stream opened with newline="".
+    """
+    lines = iter_markdown_table_lines(
+        csv_text,
+        parse=parse,
+        positions=positions,
+        add_line_numbers=add_line_numbers,
+        sort=sort,
+        eol=eol,
+        table_style=table_style,
+    )
+    return _normalize_preamble(preamble) + "".join(lines)
 
 
 NOTEBOOKLM_MIN_FIELDS = [
@@ -294,9 +467,13 @@ NOTEBOOKLM_MIN_FIELDS = [
     "Intent",
 ]
 
+# Lower-cased once; case variants of the same name ("SERP features" / "SERP Features")
+# collapse so a matching column is listed only once.
+_NOTEBOOKLM_MIN_FIELDS_LOWER: Final[tuple[str, ...]] = tuple(dict.fromkeys(f.lower() for f in NOTEBOOKLM_MIN_FIELDS))
+
 
 def csv_text_to_markdown_notebooklm(
-    csv_text: str,
+    csv_text: str | TextIO,
     preamble: str = "",
     detail: str = "minimal",
     max_rows: int | None = None,
@@ -309,6 +486,7 @@ def csv_text_to_markdown_notebooklm(
     NotebookLM-friendly output:
     - one heading per keyword
     - bullet list of key fields
+    `csv_text` may be a string or a seekable text stream opened with newline="".
     """
     if parse is None:
         parse = CsvParseOptions()
@@ -322,7 +500,7 @@ def csv_text_to_markdown_notebooklm(
     if detail.lower() == "full":
         fields = headers
     else:
-        fields = [header_map[f.lower()] for f in NOTEBOOKLM_MIN_FIELDS if f.lower() in header_map]
+        fields = [header_map[f] for f in _NOTEBOOKLM_MIN_FIELDS_LOWER if f in header_map]
         # Fallback if we didn't match anything OR we only matched the keyword column
         keyword_header_candidate = header_map.get("keyword")
         if (not fields) or (
@@ -346,19 +524,22 @@ def csv_text_to_markdown_notebooklm(
     out.append("")
     out.append("## Záznamy\n")
 
+    # Resolve every field to its column once; with duplicate header names the last
+    # column wins, as it did when each row was turned into a header -> value dict.
+    header_idx = {h: j for j, h in enumerate(headers)}
+    field_indices = [(h, header_idx[h]) for h in fields if h != keyword_header]
+    headers_len = len(headers)
+
     for i, row in enumerate(rows, start=1):
-        # Normalize row length
-        values = list(itertools.islice(itertools.chain(row, itertools.repeat("")), len(headers)))
+        # Pad short rows only
+        values = row if len(row) >= headers_len else row + [""] * (headers_len - len(row))
         kw = _escape_md_cell(values[keyword_idx]).strip()
         if not kw:
             kw = f"Řádek {i}"
         out.append(f"### {kw}")
 
-        row_by_header = {headers[j]: values[j] for j in range(len(headers))}
-        for h in fields:
-            if h == keyword_header:
-                continue
-            v = _escape_md_cell(str(row_by_header.get(h, ""))).strip()
+        for h, j in field_indices:
+            v = _escape_md_cell(values[j]).strip()
             if not v:
                 continue
             # Make links more readable in NotebookLM
@@ -367,6 +548,12 @@ def csv_text_to_markdown_notebooklm(
             out.append(f"- **{h}**: {v}")
         out.append("")
 
-    return _normalize_preamble(preamble) + "\n".join(out).rstrip() + "\n"
+    # Same as `"\n".join(out).rstrip() + "\n"`, but trims the list so the (large) joined
+    # text is built once instead of being copied by rstrip() and the final concat.
+    while len(out) > 1 and not out[-1].strip():
+        out.pop()
+    out[-1] = out[-1].rstrip()
+    out.append("")
+    return _normalize_preamble(preamble) + "\n".join(out)
 
 
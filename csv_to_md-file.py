@@ -222,7 +222,7 @@ class ReadCreate:
         headers_esc = [esc(h) for h in headers]
         out = []
         out.append("| " + " | ".join(headers_esc) + " |")
-        out.append("|" + "|".join(["---"] * len(headers_esc)) + "|")
+        out.append("|" + ("---|" * len(headers_esc) or "|"))
 
         width = len(headers_esc)
         for r in rows:
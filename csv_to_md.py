@@ -1,4 +1,7 @@
-from converter import csv_text_to_markdown_table, decode_csv_bytes
+import mmap
+import os
+
+from converter import decode_csv_bytes, iter_markdown_table_lines
 from datetime import date
 from pathlib import Path
 
@@ -14,11 +17,17 @@ Datum: {cz_date}
 
 """
 
-raw = open(INPUT, "rb").read()
-csv_text = decode_csv_bytes(raw)
-table_md = csv_text_to_markdown_table(csv_text)
+# Map the file instead of reading it into one big bytes object; the decoder reads
+# straight from the page cache. mmap cannot map an empty file.
+with open(INPUT, "rb") as f:
+    if os.fstat(f.fileno()).st_size:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as raw:
+            csv_text = decode_csv_bytes(raw)
+    else:
+        csv_text = ""
 
-with open(OUTPUT, "w", encoding="utf-8") as f:
+# Write the table line by line through a large buffer instead of building it as one string.
+with open(OUTPUT, "w", encoding="utf-8", buffering=1 << 20) as f:
     f.write(CONTEXT)
-    f.write(table_md)
+    f.writelines(iter_markdown_table_lines(csv_text))
 print("✅ Hotovo: data.md")